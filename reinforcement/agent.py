@@ -1,13 +1,120 @@
 import logging
 import random
-from random import Random
-from tkinter.tix import INTEGER
 
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:  # numba is an optional speed-up; fall back to pure Python
+    def njit(*args, **kwargs):
+        def decorate(func):
+            return func
+
+        if args and callable(args[0]):
+            return args[0]
+        return decorate
+
 from base import entorn
 from reinforcement.abstractmodel import AbstractModel
-from reinforcement.joc import Status, Action
+from reinforcement.joc import Status, Action, Cell
+
+logger = logging.getLogger(__name__)
+
+
+@njit(cache=True)
+def _argmax_random_nb(row):
+    """Index of the maximum value in 'row', breaking ties at random (numba version)."""
+    max_value = row[0]
+    for i in range(1, row.shape[0]):
+        if row[i] > max_value:
+            max_value = row[i]
+
+    ties = 0
+    for i in range(row.shape[0]):
+        if row[i] == max_value:
+            ties += 1
+
+    k = random.randrange(ties)
+    for i in range(row.shape[0]):
+        if row[i] == max_value:
+            if k == 0:
+                return i
+            k -= 1
+    return 0
+
+
+@njit(cache=True)
+def _train_episode(
+        Q,
+        next_state,
+        base_reward,
+        valid,
+        terminal,
+        blocked,
+        start_state,
+        exploration_rate,
+        learning_rate,
+        discount,
+        penalty_visited,
+        minimum_reward,
+):
+    """Play one SARSA training episode on the precomputed maze model.
+
+    All tables are indexed by the flat state 's = y * ncols + x'; 'Q' is the dense Q-table
+    reshaped to (n_states, n_actions). The maze physics (transitions and base rewards) are
+    looked up in the tables built by '_build_model'; only the penalty for revisiting a cell
+    depends on the episode history and is tracked here. Updates 'Q' in place and returns the
+    episode reward and 1 (win) or 0 (lose).
+    """
+    n_actions = Q.shape[1]
+    visited = np.zeros(Q.shape[0], dtype=np.bool_)
+    total_reward = 0.0
+
+    state = start_state
+
+    "Choose A from S using policy derived from Q (using greedy)"
+    q_row = Q[state]  # row view, reused for action selection and the TD update
+    if random.random() < exploration_rate:
+        action = random.randrange(n_actions)
+    else:
+        action = _argmax_random_nb(q_row)
+
+    while True:
+        if blocked[state]:  # cannot move anywhere, force end of game
+            total_reward += minimum_reward - 1.0
+            return total_reward, 0
+
+        "Take action A, observe R, S' "
+        ns = next_state[state, action]
+        reward = base_reward[state, action]
+        if valid[state, action]:
+            if visited[ns] and not terminal[ns]:
+                reward = penalty_visited
+            visited[ns] = True
+        total_reward += reward
+
+        "Choose A' from S' using policy derived from Q (using greedy)"
+        next_q_row = Q[ns]
+        if random.random() < exploration_rate:
+            next_action = random.randrange(n_actions)
+        else:
+            next_action = _argmax_random_nb(next_q_row)
+
+        "Q(S,A) <- Q(S,A) + alpha[R + gamma * Q(S',A') - Q(S,A)]"
+        q_row[action] += learning_rate * (
+                reward + discount * next_q_row[next_action] - q_row[action]
+        )
+
+        "(until S is terminal)"
+        if terminal[ns]:
+            return total_reward, 1
+        if total_reward < minimum_reward:
+            return total_reward, 0
+
+        "S <- S', A <- A'"
+        state = ns
+        action = next_action
+        q_row = next_q_row
 
 
 class AgentQ(AbstractModel):
@@ -32,21 +139,37 @@ class AgentQ(AbstractModel):
             kwargs: model dependent init parameters
         """
         super().__init__(game, name="QTableModel")
-        self.Q = {}  # table with value for (state, action) combination
+        nrows, ncols = game.maze.shape
+        # dense table with a value for every (state, action) combination:
+        # Q[y, x, a] is the value of taking action 'a' in cell (x, y)
+        self.Q = np.zeros((nrows, ncols, len(game.actions)), dtype=np.float32)
+        self._actions = game.actions  # cached; avoids the attribute chain on every policy call
+        self._action_index = {a: i for i, a in enumerate(game.actions)}
+        self._policy_cache = {}  # state -> best action index, cleared whenever Q changes
 
     def q(self, state):
-        """Get q values for all actions for a certain state."""
+        """Get q values for all actions for a certain state.
+
+        Returns a view into the Q-table, not a copy: no allocation per call, but callers
+        must not retain or mutate it.
+        """
         if type(state) is np.ndarray:
             state = tuple(state.flatten())
 
-        q_aprox = np.zeros(len(self.environment.actions))
-        i = 0
-        for action in self.environment.actions:
-            if (state, action) in self.Q:
-                q_aprox[i] = self.Q[(state, action)]
-            i += 1
+        return self.Q[state[1], state[0]]
 
-        return q_aprox
+    @staticmethod
+    def _argmax_random(row):
+        """Index of the maximum value in 'row', breaking ties at random."""
+        best = int(row.argmax())
+        if np.count_nonzero(row == row[best]) == 1:  # unique maximum: common after training
+            return best
+
+        ties = np.flatnonzero(row == row[best])
+        if ties.size == 0:  # pathological row (e.g. all NaN): nothing compares equal
+            return best
+
+        return int(ties[np.random.randint(ties.size)])
 
     def actua(self, percepcio) -> entorn.Accio | tuple[entorn.Accio, object]:
         """Policy: choose the action with the highest value from the Q-table. Random choice if
@@ -59,11 +182,7 @@ class AgentQ(AbstractModel):
         """
         q = self.q(percepcio["POS"])
 
-        actions = np.nonzero(q == np.max(q))[
-            0
-        ]  # get index of the action(s) with the max value
-        #print(f"Acciones de mayor indice---> {actions}")
-        return random.choice(actions)
+        return self._argmax_random(q)
 
     def pinta(self, display) -> None:
         pass
@@ -78,12 +197,20 @@ class AgentQ(AbstractModel):
         Returns:
             Action. Selected action
         """
+        if type(state) is np.ndarray:
+            state = tuple(state.flatten())
+
+        cached = self._policy_cache.get(state)
+        if cached is not None:
+            return self._actions[cached]
+
         q = self.q(state)
+        best = self._argmax_random(q)
+        if np.count_nonzero(q == q[best]) == 1:
+            # only cache unambiguous maxima, so ties keep their random tie-break
+            self._policy_cache[state] = best
 
-        actions = np.nonzero(q == np.max(q))[
-            0
-        ]  # get index of the action(s) with the max value
-        return self.environment.actions[random.choice(actions)]
+        return self._actions[best]
 
     def print_Q(self):
         """ Print Q table.
@@ -96,78 +223,42 @@ class AgentQ(AbstractModel):
 
         Author: Dylan Luigi Canning.
         """
-        # Extract all unique states from the Q-table
-        states = set(state for (state, action) in self.Q.keys())
+        # Reduce the whole dense Q-table at once instead of looping per state
+        max_q = self.Q.max(axis=2)
+        best_a = self.Q.argmax(axis=2)
+        visited = (self.Q != 0.0).any(axis=2)  # states with at least one learned value
+        ties = (self.Q == max_q[..., None]).sum(axis=2) > 1  # several actions share the max
 
-        if not states:
+        if not visited.any():
             print("Q-table is empty.")
             return
 
-        # Determine the grid dimensions
-        xs = [s[0] for s in states]
-        ys = [s[1] for s in states]
-        min_x, max_x = min(xs), max(xs)
-        min_y, max_y = min(ys), max(ys)
-
-        # Calculate grid size
-        width = max_x - min_x + 1
-        height = max_y - min_y + 1
-
-        # Initialize the Q-values matrix with None
-        Q_matrix = np.full((height, width), None, dtype=object)
-
-        # Initialize the Policy matrix with None
-        Policy_matrix = np.full((height, width), None, dtype=object)
-
-        # Populate the Q-values and Policy matrices
-        for state in states:
-            x, y = state
-            # Get all Q-values for the current state across all possible actions
-            actions_q = {
-                action: self.Q.get((state, action), 0.0)
-                for action in self.environment.actions
-            }
-
-            if actions_q:
-                # Determine the maximum Q-value for the current state
-                max_q = max(actions_q.values())
-                # Find all actions that have the maximum Q-value
-                max_actions = [action for action, q in actions_q.items() if q == max_q]
-                # Choose one action randomly among those with the max Q-value
-                best_action = random.choice(max_actions)
-            else:
-                max_q = 0.0
-                best_action = '-'
-
-            # Adjust indices if states do not start at (0,0)
-            matrix_y = y - min_y  # Row index
-            matrix_x = x - min_x  # Column index
-
-            Q_matrix[matrix_y][matrix_x] = max_q
-            Policy_matrix[matrix_y][matrix_x] = AgentQ._action_to_symbol(best_action)
-
-        # Convert None to a placeholder (e.g., '-') for better readability
-        Q_matrix_display = np.where(Q_matrix == None, '-', Q_matrix)
-        Policy_matrix_display = np.where(Policy_matrix == None, '-', Policy_matrix)
+        height, width = self.Q.shape[:2]
 
         # Print the Q-values matrix
         print("Q-Table Maximum Values (Rows: Y-axis, Columns: X-axis):")
-        for row in Q_matrix_display:
+        for y in range(height):
             row_display = ""
-            for cell in row:
-                if cell == '-':
-                    row_display += f"{cell:^6} "  # Center the placeholder
+            for x in range(width):
+                if visited[y, x]:
+                    row_display += f"{max_q[y, x]:6.2f} "  # Format Q-values to two decimal places
                 else:
-                    row_display += f"{cell:6.2f} "  # Format Q-values to two decimal places
+                    row_display += f"{'-':^6} "  # Center the placeholder
             print(row_display)
         print()  # Add an empty line for better readability
 
         # Print the Policy matrix
         print("Policy Matrix (Rows: Y-axis, Columns: X-axis):")
-        for row in Policy_matrix_display:
+        for y in range(height):
             row_display = ""
-            for cell in row:
-                row_display += f"{cell:^6} "  # Center the action symbol or placeholder
+            for x in range(width):
+                if not visited[y, x]:
+                    symbol = '-'
+                elif ties[y, x]:
+                    symbol = '?'  # ambiguous policy: several actions share the max value
+                else:
+                    symbol = AgentQ._action_to_symbol(self._actions[best_a[y, x]])
+                row_display += f"{symbol:^6} "  # Center the action symbol or placeholder
             print(row_display)
 
     @staticmethod
@@ -189,6 +280,64 @@ class AgentQ(AbstractModel):
         }
         return action_mapping.get(action, '?')  # '?' for undefined actions
 
+    def _build_model(self, maze):
+        """Precompute the maze physics as flat arrays, indexed by 's = y * ncols + x'.
+
+        Enumerates every cell x action pair once and applies the same rules as the
+        environment (maze edges, walls, exit reward, move penalties), so the training
+        kernel only does indexed loads per step.
+
+        Args:
+            maze (np.array): 2D array, 0 = free cell, 1 = wall
+
+        Returns:
+            next_state (np.array): (n_states, n_actions) flat index of the successor state
+            base_reward (np.array): (n_states, n_actions) reward, ignoring revisit penalties
+            valid (np.array): (n_states, n_actions) whether the move is possible
+            terminal (np.array): (n_states,) whether the state is the exit cell
+            blocked (np.array): (n_states,) whether no move at all is possible
+        """
+        nrows, ncols = maze.shape
+        n_states = nrows * ncols
+        actions = self.environment.actions
+        n_actions = len(actions)
+        exit_cell = self.environment.exit_cell
+
+        moves = {
+            Action.MOVE_LEFT: (-1, 0),
+            Action.MOVE_RIGHT: (1, 0),
+            Action.MOVE_UP: (0, -1),
+            Action.MOVE_DOWN: (0, 1),
+        }
+
+        next_state = np.zeros((n_states, n_actions), dtype=np.int32)
+        base_reward = np.zeros((n_states, n_actions), dtype=np.float32)
+        valid = np.zeros((n_states, n_actions), dtype=np.bool_)
+        terminal = np.zeros(n_states, dtype=np.bool_)
+        blocked = np.zeros(n_states, dtype=np.bool_)
+
+        terminal[exit_cell[1] * ncols + exit_cell[0]] = True
+        for cy in range(nrows):
+            for cx in range(ncols):
+                s = cy * ncols + cx
+                for a_i, action in enumerate(actions):
+                    dx, dy = moves[action]
+                    tx, ty = cx + dx, cy + dy
+                    if 0 <= tx < ncols and 0 <= ty < nrows and maze[ty, tx] != Cell.OCCUPIED:
+                        valid[s, a_i] = True
+                        next_state[s, a_i] = ty * ncols + tx
+                        base_reward[s, a_i] = (
+                            self.environment.reward_exit
+                            if (tx, ty) == exit_cell
+                            else self.environment.penalty_move
+                        )
+                    else:
+                        next_state[s, a_i] = s
+                        base_reward[s, a_i] = self.environment.penalty_impossible_move
+                blocked[s] = not valid[s].any()
+
+        return next_state, base_reward, valid, terminal, blocked
+
     def train(
             self,
             discount,
@@ -222,118 +371,186 @@ class AgentQ(AbstractModel):
 
         # start_time = datetime.now()
         # training starts here
-        maze = np.array(
-            [
-                [0, 1, 0, 0, 0, 0, 0, 0],
-                [0, 1, 0, 1, 0, 1, 0, 0],
-                [0, 1, 0, 1, 1, 0, 1, 0],
-                [0, 1, 0, 1, 0, 0, 0, 0],
-                [0, 1, 0, 1, 0, 1, 0, 0],
-                [0, 0, 0, 1, 0, 1, 1, 1],
-                [0, 1, 1, 0, 0, 0, 0, 0],
-                [0, 1, 0, 0, 0, 1, 0, 0],
-            ]
-        )  # 0 = free, 1 = occupied
-        x = 0
-        y = 0
+        maze = self.environment.maze  # 0 = free, 1 = occupied
+        # precompute the maze model (transitions, rewards and terminal cells) once, so the
+        # jitted episode kernel never has to call back into Python
+        nrows, ncols = maze.shape
+        n_actions = len(self.environment.actions)
+        minimum_reward = -0.5 * maze.size
+        next_state, base_reward, valid, terminal, blocked = self._build_model(maze)
+
+        # flat (n_states, n_actions) view of the Q-table, matching the model tables
+        Q_flat = self.Q.reshape(nrows * ncols, n_actions)
+
+        # scalars enter the kernel as float32 so the TD arithmetic stays in float32,
+        # matching the Q-table and reward table dtypes
+        learning_rate = np.float32(learning_rate)
+        discount = np.float32(discount)
+        penalty_visited = np.float32(self.environment.penalty_visited)
+        minimum_reward = np.float32(minimum_reward)
+
+        # free cells in raster order; episodes cycle through them as starting cells
+        free_cells = np.argwhere(maze == 0)  # (n_free, 2) in (y, x) order
+        n_free = len(free_cells)
+        y, x = free_cells[0]
 
         "Loop for each episode:"
         for episode in range(1, episodes + 1):
 
-            "Initialize S"
-            state = self.environment.reset((x,y))
-
-            "Choose A from S using policy derived from Q (using greedy)"
-            # choose action epsilon greedy
-            if np.random.random() < exploration_rate:
-                action = random.choice(self.environment.actions)
-            else:
-                action = self.predict(state)
-
-            "(Ensure certainty)"
-            if (
-                    state,
-                    action,
-            ) not in self.Q.keys():  # ensure value exists for (state, action)
-                # to avoid a KeyError
-                self.Q[(state, action)] = 0.0
-
-            while True:
-
-                "Take action A, observe R, S' "
-                next_state, reward, status = self.environment._aplica(action)
-                cumulative_reward += reward
-
-                "Choose A' from S' using policy derived from Q (using greedy)"
-                # choose action epsilon greedy
-                if  np.random.random() < exploration_rate:
-                    next_action = random.choice(self.environment.actions)
-                else:
-                    next_action = self.predict(next_state)
+            episode_reward, won = _train_episode(
+                Q_flat,
+                next_state,
+                base_reward,
+                valid,
+                terminal,
+                blocked,
+                y * ncols + x,
+                np.float32(exploration_rate),
+                learning_rate,
+                discount,
+                penalty_visited,
+                minimum_reward,
+            )
+            cumulative_reward += episode_reward
+            status = Status.WIN if won else Status.LOSE
 
-                "(Ensure certainty)"
-                if (
-                        next_state,
-                        next_action,
-                ) not in self.Q.keys():  # ensure value exists for (state, action)
-                    # to avoid a KeyError
-                    self.Q[(next_state, next_action)] = 0.0
+            cumulative_reward_history.append(cumulative_reward)
+            exploration_rate = max(min_exploration_rate, exploration_rate * decay_rate)
 
+            logger.info(
+                "episode: %d/%d | status: %-4s | e: %.5f | (x,y): (%d,%d)",
+                episode, episodes, status.name, exploration_rate, x, y,
+            )
 
-                "Q(S,A) <- Q(S,A) + alpha[R + gamma * Q(S',A') - Q(S,A)]"
-                self.Q[(state, action)] = self.Q[(state, action)] + learning_rate * (
-                        reward + discount * self.Q[(next_state,next_action)] - self.Q[(state, action)]
-                )
+            #Actualizar casilla de entrenamiento
+            y, x = free_cells[episode % n_free]
 
-                "(until S is terminal)"
-                if status in (
-                        Status.WIN,
-                        Status.LOSE,
-                ):  # terminal state reached, stop episode
-                    break
+        logger.info("episodes: %d", episode)
 
-                "S <- S'"
-                state = next_state
+        self._policy_cache.clear()  # Q has changed, cached best actions are stale
 
-                "A <- A'"
-                action = next_action
+        return cumulative_reward_history, win_history, episode
 
-            cumulative_reward_history.append(cumulative_reward)
-            exploration_rate = max(min_exploration_rate, exploration_rate * decay_rate)
+    def train_vectorized(
+            self,
+            discount,
+            exploration_rate,
+            learning_rate,
+            episodes,
+            stop_at_convergence=False,
+    ):
+        """ Train the model by advancing a batch of episodes in lock-step.
 
-            logging.info(
-                "episode: {:d}/{:d} | status: {:4s} | e: {:.5f} | (x,y): ({:d},{:d})".format(
-                    episode, episodes, status.name, exploration_rate, x, y
+        One episode runs from every free starting cell at once: state, action and reward
+        are vectors, transitions are table lookups and the SARSA update is a scatter-add
+        (np.add.at), so the Python overhead of each step is amortized over the whole batch.
+        Episodes finish and restart independently; hyperparameters and the returned values
+        match 'train'.
+
+        Args:
+            stop_at_convergence: stop training as soon as convergence is reached.
+
+        Hyperparameters:
+            discount (float): (gamma) preference for future rewards (0 = not at all, 1 = only)
+            exploration_rate (float): exploration rate reduction after each random step
+                                (<= 1, 1 = no at all)
+            learning_rate (float): preference for using new knowledge (0 = not at all, 1 = only)
+            episodes (int): number of training games to play
+
+        Returns:
+            Int, datetime: number of training episodes, total time spent
+        """
+
+        # variables for reporting purposes
+        cumulative_reward = 0
+        cumulative_reward_history = []
+        win_history = []
+        min_exploration_rate = 0.01
+        decay_rate = 0.9975
+
+        maze = self.environment.maze
+        nrows, ncols = maze.shape
+        n_actions = len(self.environment.actions)
+        minimum_reward = -0.5 * maze.size
+        next_state, base_reward, valid, terminal, blocked = self._build_model(maze)
+
+        Q = self.Q.reshape(nrows * ncols, n_actions)
+
+        free_cells = np.argwhere(maze == 0)  # (n_free, 2) in (y, x) order
+        starts = (free_cells[:, 0] * ncols + free_cells[:, 1]).astype(np.int32)
+        batch = min(len(starts), episodes)
+        batch_idx = np.arange(batch)
+
+        def select_actions(rows):
+            """Epsilon-greedy action for every row, breaking argmax ties at random."""
+            explore = np.random.random(batch) < exploration_rate
+            is_max = rows == rows.max(axis=1, keepdims=True)
+            greedy = np.argmax(np.random.random(rows.shape) * is_max, axis=1)
+            random_a = np.random.randint(n_actions, size=batch)
+            return np.where(explore, random_a, greedy).astype(np.int32)
+
+        state = starts[:batch].copy()
+        next_start = batch  # position in the start-cell cycle for restarts
+        total_reward = np.zeros(batch)
+        visited = np.zeros((batch, nrows * ncols), dtype=np.bool_)
+
+        episode = 0
+        action = select_actions(Q[state])
+        while episode < episodes:
+            "Take action A, observe R, S' (whole batch at once)"
+            ns = next_state[state, action]
+            reward = base_reward[state, action].astype(np.float64)
+            ok = valid[state, action]
+            revisit = ok & visited[batch_idx, ns] & ~terminal[ns]
+            reward[revisit] = self.environment.penalty_visited
+            visited[batch_idx[ok], ns[ok]] = True
+            stuck = blocked[state]
+            reward[stuck] = minimum_reward - 1.0
+            total_reward += reward
+
+            "Choose A' and apply the SARSA update with a scatter-add"
+            next_action = select_actions(Q[ns])
+            td = reward + discount * Q[ns, next_action] - Q[state, action]
+            # average the TD contributions of duplicate (state, action) pairs in the
+            # batch: summing them makes the effective step size k * learning_rate,
+            # which exceeds 1 and diverges at the repo's default hyperparameters
+            keys = state.astype(np.int64) * n_actions + action
+            _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            np.add.at(Q, (state, action), learning_rate * td / counts[inverse])
+
+            done = terminal[ns] | (total_reward < minimum_reward) | stuck
+            won = terminal[ns]
+            state = ns
+            action = next_action
+
+            "Restart finished episodes independently"
+            for b in np.flatnonzero(done):
+                episode += 1
+                cumulative_reward += total_reward[b]
+                cumulative_reward_history.append(cumulative_reward)
+                status = Status.WIN if won[b] else Status.LOSE
+                exploration_rate = max(
+                    min_exploration_rate, exploration_rate * decay_rate
                 )
-            )
 
-            #Actualizar casilla de entrenamiento
-            if y < np.sqrt(maze.size) - 1:
-                if x < np.sqrt(maze.size) - 1:
-                    x = x + 1
-                else:
-                    x = 0
-                    y = y + 1
-            else:
-                if x < np.sqrt(maze.size) - 1:
-                    x = x + 1
-                else:
-                    x = 0
-                    y = 0
-            while maze[y,x] == 1:
-                if y < np.sqrt(maze.size) - 1:
-                    if x < np.sqrt(maze.size) - 1:
-                        x = x + 1
-                    else:
-                        x = 0
-                        y = y + 1
+                logger.info(
+                    "episode: %d/%d | status: %-4s | e: %.5f",
+                    episode, episodes, status.name, exploration_rate,
+                )
+
+                state[b] = starts[next_start % len(starts)]
+                next_start += 1
+                total_reward[b] = 0.0
+                visited[b, :] = False
+                if random.random() < exploration_rate:
+                    action[b] = random.randrange(n_actions)
                 else:
-                    if x < np.sqrt(maze.size) - 1:
-                        x = x + 1
-                    else:
-                        x = 0
-                        y = 0
+                    action[b] = self._argmax_random(Q[state[b]])
+                if episode >= episodes:
+                    break
+
+        logger.info("episodes: %d", episode)
 
-        logging.info("episodes: {:d}".format(episode))
+        self._policy_cache.clear()  # Q has changed, cached best actions are stale
 
         return cumulative_reward_history, win_history, episode
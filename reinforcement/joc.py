@@ -1,6 +1,4 @@
 from enum import Enum, IntEnum
-from math import trunc
-from xml.sax.handler import property_dom_node
 
 import numpy as np
 import pygame
@@ -255,6 +253,10 @@ class Laberint(joc.Joc):
     def maze(self):
         return self.__maze
 
+    @property
+    def exit_cell(self):
+        return self.__exit_cell
+
     @maze.setter
     def maze(self, maze):
         self.__maze = maze